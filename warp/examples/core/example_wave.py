@@ -15,223 +15,534 @@
 
 import math
 
+import numpy as np
+
 import warp as wp
 import warp.render
 
+# simulation constants, folded into the kernels at compile time
+SIM_WIDTH = wp.constant(128)
+SIM_HEIGHT = wp.constant(128)
+
+SIM_FPS = 60
+SIM_SUBSTEPS = 16
+SIM_DT = wp.constant((1.0 / SIM_FPS) / SIM_SUBSTEPS)
+
+# each frame must end on sim_grid0 for CUDA graph replay
+assert SIM_SUBSTEPS % 2 == 0
+
+GRID_SIZE = 0.1
+INV_CELL = wp.constant(1.0 / GRID_SIZE)
 
+K_SPEED = wp.constant(1.0)
+K_DAMP = wp.constant(0.0)
+
+
+# grids carry a one cell halo of zeros as a fixed boundary
 @wp.func
-def sample(f: wp.array(dtype=float), x: int, y: int, width: int, height: int):
-    # clamp texture coords
-    x = wp.clamp(x, 0, width - 1)
-    y = wp.clamp(y, 0, height - 1)
+def grid_index(x: int, y: int, width: int):
+    return (y + 1) * (width + 2) + (x + 1)
 
-    s = f[y * width + x]
-    return s
+
+@wp.func
+def sample(f: wp.array(dtype=float), x: int, y: int, width: int):
+    return f[grid_index(x, y, width)]
 
 
 @wp.func
-def laplacian(f: wp.array(dtype=float), x: int, y: int, width: int, height: int):
-    ddx = sample(f, x + 1, y, width, height) - 2.0 * sample(f, x, y, width, height) + sample(f, x - 1, y, width, height)
-    ddy = sample(f, x, y + 1, width, height) - 2.0 * sample(f, x, y, width, height) + sample(f, x, y - 1, width, height)
+def laplacian(f: wp.array(dtype=float), x: int, y: int, width: int):
+    ddx = sample(f, x + 1, y, width) - 2.0 * sample(f, x, y, width) + sample(f, x - 1, y, width)
+    ddy = sample(f, x, y + 1, width) - 2.0 * sample(f, x, y, width) + sample(f, x, y - 1, width)
 
     return ddx + ddy
 
 
-@wp.kernel
-def wave_displace(
-    hcurrent: wp.array(dtype=float),
-    hprevious: wp.array(dtype=float),
+@wp.func
+def sample_displaced(
+    f: wp.array(dtype=float),
+    x: int,
+    y: int,
     width: int,
-    height: int,
     center_x: float,
     center_y: float,
     r: float,
-    mag: float,
-    t: float,
+    h_displace: float,
 ):
-    tid = wp.tid()
-
-    x = tid % width
-    y = tid // width
-
     dx = float(x) - center_x
     dy = float(y) - center_y
 
-    dist_sq = float(dx * dx + dy * dy)
+    # cells inside the disk read as displaced
+    if dx * dx + dy * dy < r * r:
+        return h_displace
 
-    if dist_sq < r * r:
-        h = mag * wp.sin(t)
+    return f[grid_index(x, y, width)]
 
-        hcurrent[tid] = h
-        hprevious[tid] = h
 
+@wp.func
+def laplacian_displaced(
+    f: wp.array(dtype=float),
+    x: int,
+    y: int,
+    width: int,
+    center_x: float,
+    center_y: float,
+    r: float,
+    h_displace: float,
+):
+    c = sample_displaced(f, x, y, width, center_x, center_y, r, h_displace)
 
-@wp.kernel
-def wave_solve(
+    ddx = (
+        sample_displaced(f, x + 1, y, width, center_x, center_y, r, h_displace)
+        - 2.0 * c
+        + sample_displaced(f, x - 1, y, width, center_x, center_y, r, h_displace)
+    )
+    ddy = (
+        sample_displaced(f, x, y + 1, width, center_x, center_y, r, h_displace)
+        - 2.0 * c
+        + sample_displaced(f, x, y - 1, width, center_x, center_y, r, h_displace)
+    )
+
+    return ddx + ddy
+
+
+@wp.func
+def wave_cell(
     hprevious: wp.array(dtype=float),
     hcurrent: wp.array(dtype=float),
+    x: int,
+    y: int,
     width: int,
-    height: int,
     inv_cell: float,
     k_speed: float,
     k_damp: float,
     dt: float,
+    center_x: float,
+    center_y: float,
+    r: float,
+    h_displace: float,
+    near_disk: bool,
 ):
-    tid = wp.tid()
+    idx = grid_index(x, y, width)
 
-    x = tid % width
-    y = tid // width
+    h1 = hcurrent[idx]
+    h0 = hprevious[idx]
 
-    l = laplacian(hcurrent, x, y, width, height) * inv_cell * inv_cell
+    l = float(0.0)
 
-    # integrate
-    h1 = hcurrent[tid]
-    h0 = hprevious[tid]
+    # cells of tiles away from the disk skip the disk test
+    if near_disk:
+        dx = float(x) - center_x
+        dy = float(y) - center_y
+
+        dist_sq = dx * dx + dy * dy
+
+        if dist_sq < r * r:
+            h1 = h_displace
+            h0 = h_displace
+
+            # race-free since neighbors never read disk cells from memory
+            hcurrent[idx] = h_displace
 
+        # stencils touching the disk
+        if dist_sq < (r + 1.0) * (r + 1.0):
+            l = laplacian_displaced(hcurrent, x, y, width, center_x, center_y, r, h_displace)
+        else:
+            l = laplacian(hcurrent, x, y, width)
+    else:
+        l = laplacian(hcurrent, x, y, width)
+
+    l = l * inv_cell * inv_cell
+
+    # integrate
     h = 2.0 * h1 - h0 + dt * dt * (k_speed * l - k_damp * (h1 - h0))
 
     # buffers get swapped each iteration
-    hprevious[tid] = h
+    hprevious[idx] = h
+
+
+# returns True if any stencil of the tile can touch the displacement disk
+@wp.func
+def tile_near_disk(x_begin: int, y_begin: int, x_end: int, y_end: int, center_x: float, center_y: float, r: float):
+    dx = center_x - wp.clamp(center_x, float(x_begin), float(x_end - 1))
+    dy = center_y - wp.clamp(center_y, float(y_begin), float(y_end - 1))
+
+    return dx * dx + dy * dy < (r + 1.0) * (r + 1.0)
+
+
+@wp.kernel
+def wave_solve(
+    hprevious: wp.array(dtype=float),
+    hcurrent: wp.array(dtype=float),
+    centers: wp.array(dtype=wp.vec2),
+    center_offset: wp.array(dtype=int),
+    substep: int,
+    r: float,
+    mag: float,
+    t: float,
+    tile_width: int,
+    tile_height: int,
+):
+    # one block of threads per tile of cells
+    tile_y, tile_x, j, i = wp.tid()
+
+    x_begin = tile_x * tile_width
+    y_begin = tile_y * tile_height
+
+    x = x_begin + i
+    y = y_begin + j
+
+    # surface displacement around a point
+    center = centers[center_offset[0] + substep]
+    h_displace = mag * wp.sin(t)
+
+    # uniform across the block
+    near_disk = tile_near_disk(x_begin, y_begin, x_begin + tile_width, y_begin + tile_height, center[0], center[1], r)
+
+    # a return here would also exit the grid-stride loop
+    if x < SIM_WIDTH and y < SIM_HEIGHT:
+        wave_cell(
+            hprevious,
+            hcurrent,
+            x,
+            y,
+            SIM_WIDTH,
+            INV_CELL,
+            K_SPEED,
+            K_DAMP,
+            SIM_DT,
+            center[0],
+            center[1],
+            r,
+            h_displace,
+            near_disk,
+        )
+
+
+@wp.func
+def wave_tile(
+    hprevious: wp.array(dtype=float),
+    hcurrent: wp.array(dtype=float),
+    x_begin: int,
+    y_begin: int,
+    x_end: int,
+    y_end: int,
+    center: wp.vec2,
+    r: float,
+    h_displace: float,
+    near_disk: bool,
+):
+    for y in range(y_begin, y_end):
+        for x in range(x_begin, x_end):
+            wave_cell(
+                hprevious,
+                hcurrent,
+                x,
+                y,
+                SIM_WIDTH,
+                INV_CELL,
+                K_SPEED,
+                K_DAMP,
+                SIM_DT,
+                center[0],
+                center[1],
+                r,
+                h_displace,
+                near_disk,
+            )
+
+
+# CPU variant of wave_solve(), one thread per tile of cells
+@wp.kernel
+def wave_solve_tiled(
+    hprevious: wp.array(dtype=float),
+    hcurrent: wp.array(dtype=float),
+    centers: wp.array(dtype=wp.vec2),
+    center_offset: wp.array(dtype=int),
+    substep: int,
+    r: float,
+    mag: float,
+    t: float,
+    tile_width: int,
+    tile_height: int,
+):
+    tile_y, tile_x = wp.tid()
+
+    center = centers[center_offset[0] + substep]
+    h_displace = mag * wp.sin(t)
+
+    x_begin = tile_x * tile_width
+    y_begin = tile_y * tile_height
+    x_end = wp.min(x_begin + tile_width, SIM_WIDTH)
+    y_end = wp.min(y_begin + tile_height, SIM_HEIGHT)
+
+    # literal flags keep the disk test out of the loop
+    if tile_near_disk(x_begin, y_begin, x_end, y_end, center[0], center[1], r):
+        wave_tile(hprevious, hcurrent, x_begin, y_begin, x_end, y_end, center, r, h_displace, True)
+    else:
+        wave_tile(hprevious, hcurrent, x_begin, y_begin, x_end, y_end, center, r, h_displace, False)
+
+
+# moves the displacement centers of the next frame into place
+@wp.kernel
+def advance_centers(center_offset: wp.array(dtype=int), substeps: int):
+    center_offset[0] = center_offset[0] + substeps
 
 
 # simple kernel to apply height deltas to a vertex array
 @wp.kernel
 def grid_update(heights: wp.array(dtype=float), vertices: wp.array(dtype=wp.vec3)):
-    tid = wp.tid()
+    y, x = wp.tid()
+
+    idx = y * SIM_WIDTH + x
 
-    h = heights[tid]
-    v = vertices[tid]
+    h = heights[grid_index(x, y, SIM_WIDTH)]
+    v = vertices[idx]
 
     v_new = wp.vec3(v[0], h, v[2])
 
-    vertices[tid] = v_new
+    vertices[idx] = v_new
 
 
 class Example:
-    def __init__(self, stage_path="example_wave.usd", verbose=False):
-        self.sim_width = 128
-        self.sim_height = 128
+    def __init__(self, stage_path="example_wave.usd", verbose=False, max_blocks=0):
+        self.sim_width = SIM_WIDTH
+        self.sim_height = SIM_HEIGHT
 
-        fps = 60
-        self.sim_substeps = 16
-        self.sim_dt = (1.0 / fps) / self.sim_substeps
+        self.frame_dt = 1.0 / SIM_FPS
+        self.sim_substeps = SIM_SUBSTEPS
+        self.sim_dt = SIM_DT
         self.sim_time = 0.0
 
-        # wave constants
-        self.k_speed = 1.0
-        self.k_damp = 0.0
-
         # grid constants
-        self.grid_size = 0.1
+        self.grid_size = GRID_SIZE
         self.grid_displace = 0.5
 
         self.verbose = verbose
 
-        vertices = []
-        self.indices = []
+        self.device = wp.get_device()
 
-        def grid_index(x, y, stride):
-            return y * stride + x
+        # tile size of the solver
+        if self.device.is_cpu:
+            self.tile_width = 64
+            self.tile_height = 8
+        else:
+            self.tile_width = 32
+            self.tile_height = 8
 
-        for z in range(self.sim_height):
-            for x in range(self.sim_width):
-                pos = (
-                    float(x) * self.grid_size,
-                    0.0,
-                    float(z) * self.grid_size,
-                )
+        # cap on the CUDA blocks of the solver, 0 for one block per tile
+        self.max_blocks = max_blocks
+
+        self.sim_tiles = (
+            (self.sim_height + self.tile_height - 1) // self.tile_height,
+            (self.sim_width + self.tile_width - 1) // self.tile_width,
+        )
 
-                # directly modifies verts_host memory since this is a numpy alias of the same buffer
-                vertices.append(pos)
+        # grid vertices, laid out row by row along z
+        xs, zs = np.meshgrid(np.arange(self.sim_width), np.arange(self.sim_height))
 
-                if x > 0 and z > 0:
-                    self.indices.append(grid_index(x - 1, z - 1, self.sim_width))
-                    self.indices.append(grid_index(x, z, self.sim_width))
-                    self.indices.append(grid_index(x, z - 1, self.sim_width))
+        vertices = np.zeros((self.sim_width * self.sim_height, 3), dtype=np.float32)
+        vertices[:, 0] = xs.ravel() * self.grid_size
+        vertices[:, 2] = zs.ravel() * self.grid_size
 
-                    self.indices.append(grid_index(x - 1, z - 1, self.sim_width))
-                    self.indices.append(grid_index(x - 1, z, self.sim_width))
-                    self.indices.append(grid_index(x, z, self.sim_width))
+        # two triangles per grid cell, indexed from the cell's lower corner
+        i00 = (zs[:-1, :-1] * self.sim_width + xs[:-1, :-1]).ravel()
+        i10 = i00 + 1
+        i01 = i00 + self.sim_width
+        i11 = i01 + 1
 
-        # simulation grids
-        self.sim_grid0 = wp.zeros(self.sim_width * self.sim_height, dtype=float)
-        self.sim_grid1 = wp.zeros(self.sim_width * self.sim_height, dtype=float)
+        self.indices = np.column_stack((i00, i11, i10, i00, i01, i11)).reshape(-1).astype(np.int32)
+
+        # simulation grids, two views of one allocation
+        grid_cells = (self.sim_width + 2) * (self.sim_height + 2)
+        self.sim_grids = wp.zeros(2 * grid_cells, dtype=float)
+        self.sim_grid0 = self.sim_grids[:grid_cells]
+        self.sim_grid1 = self.sim_grids[grid_cells:]
         self.sim_verts = wp.array(vertices, dtype=wp.vec3)
 
         # create surface displacement around a point
         self.cx = self.sim_width / 2 + math.sin(self.sim_time) * self.sim_width / 3
         self.cy = self.sim_height / 2 + math.cos(self.sim_time) * self.sim_height / 3
 
+        # displacement centers for a window of frames, refilled by step()
+        self.center_frames = 8
+        self.sim_centers = wp.zeros(self.center_frames * self.sim_substeps, dtype=wp.vec2)
+        self.sim_center_offset = wp.zeros(1, dtype=int)
+        self.update_centers()
+
+        # device timing of the simulation, read back one frame late
+        self.sim_timing = self.verbose and self.device.is_cuda
+        if self.sim_timing:
+            self.sim_events = [(wp.Event(enable_timing=True), wp.Event(enable_timing=True)) for _ in range(2)]
+            self.sim_timed_frames = 0
+
+        # replay the substeps from a CUDA graph
+        self.use_cuda_graph = self.device.is_cuda and not wp.config.verify_cuda
+        if self.use_cuda_graph:
+            with wp.ScopedCapture() as capture:
+                self.simulate()
+            self.graph = capture.graph
+
         if stage_path:
             self.renderer = wp.render.UsdRenderer(stage_path)
         else:
             self.renderer = None
 
-    def step(self):
-        with wp.ScopedTimer("step"):
-            for _s in range(self.sim_substeps):
-                # create surface displacement around a point
-                self.cx = self.sim_width / 2 + math.sin(self.sim_time) * self.sim_width / 3
-                self.cy = self.sim_height / 2 + math.cos(self.sim_time) * self.sim_height / 3
-
-                wp.launch(
-                    kernel=wave_displace,
-                    dim=self.sim_width * self.sim_height,
-                    inputs=[
-                        self.sim_grid0,
-                        self.sim_grid1,
-                        self.sim_width,
-                        self.sim_height,
-                        self.cx,
-                        self.cy,
-                        10.0,
-                        self.grid_displace,
-                        -math.pi * 0.5,
-                    ],
-                )
-
-                # integrate wave equation
+        self.render_frame = 0
+        self.surface_rendered = False
+
+        # on CUDA, copy vertices to the host asynchronously and render a frame late
+        self.use_async_copy = self.device.is_cuda and self.renderer is not None
+        if self.use_async_copy:
+            self.copy_stream = wp.Stream(self.device)
+            self.sim_verts_back = wp.clone(self.sim_verts)
+            self.host_verts = [wp.empty(len(vertices), dtype=wp.vec3, device="cpu", pinned=True) for _ in range(2)]
+            self.copy_events = [None, None]
+            self.pending_frame = None
+
+    def simulate(self):
+        for substep in range(self.sim_substeps):
+            inputs = [
+                self.sim_grid0,
+                self.sim_grid1,
+                self.sim_centers,
+                self.sim_center_offset,
+                substep,
+                10.0,
+                self.grid_displace,
+                -math.pi * 0.5,
+                self.tile_width,
+                self.tile_height,
+            ]
+
+            # apply displacement and integrate wave equation
+            if self.device.is_cpu:
+                wp.launch(kernel=wave_solve_tiled, dim=self.sim_tiles, inputs=inputs)
+            else:
                 wp.launch(
                     kernel=wave_solve,
-                    dim=self.sim_width * self.sim_height,
-                    inputs=[
-                        self.sim_grid0,
-                        self.sim_grid1,
-                        self.sim_width,
-                        self.sim_height,
-                        1.0 / self.grid_size,
-                        self.k_speed,
-                        self.k_damp,
-                        self.sim_dt,
-                    ],
+                    dim=(*self.sim_tiles, self.tile_height, self.tile_width),
+                    inputs=inputs,
+                    block_dim=self.tile_width * self.tile_height,
+                    max_blocks=self.max_blocks,
                 )
 
-                # swap grids
-                (self.sim_grid0, self.sim_grid1) = (self.sim_grid1, self.sim_grid0)
+            # swap grids
+            (self.sim_grid0, self.sim_grid1) = (self.sim_grid1, self.sim_grid0)
+
+        wp.launch(kernel=advance_centers, dim=1, inputs=[self.sim_center_offset, self.sim_substeps])
+
+    def update_centers(self):
+        # create surface displacement around a moving point
+        t = self.sim_time + np.arange(self.center_frames * self.sim_substeps) * self.sim_dt
+
+        self.centers = np.stack(
+            (
+                self.sim_width / 2 + np.sin(t) * self.sim_width / 3,
+                self.sim_height / 2 + np.cos(t) * self.sim_height / 3,
+            ),
+            axis=1,
+        )
+        self.sim_centers.assign(self.centers)
+        self.sim_center_offset.zero_()
+        self.sim_frame = 0
+
+    def step(self):
+        with wp.ScopedTimer("step") as timer:
+            # refill the displacement centers
+            if self.sim_frame == self.center_frames:
+                self.update_centers()
+
+            if self.sim_timing:
+                start_event, end_event = self.sim_events[self.sim_timed_frames % 2]
+                wp.record_event(start_event)
 
-                self.sim_time += self.sim_dt
+            if self.use_cuda_graph:
+                wp.capture_launch(self.graph)
+            else:
+                self.simulate()
 
-        with wp.ScopedTimer("mesh", self.verbose):
-            # update grid vertices from heights
-            wp.launch(kernel=grid_update, dim=self.sim_width * self.sim_height, inputs=[self.sim_grid0, self.sim_verts])
+            if self.sim_timing:
+                wp.record_event(end_event)
+
+                if self.sim_timed_frames > 0:
+                    prev_start_event, prev_end_event = self.sim_events[(self.sim_timed_frames - 1) % 2]
+                    elapsed = wp.get_event_elapsed_time(prev_start_event, prev_end_event)
+                    timer.extra_msg = f"(previous frame simulated in {elapsed:.2f} ms on device)"
+
+                self.sim_timed_frames += 1
+
+            self.sim_frame += 1
+            self.cx, self.cy = self.centers[self.sim_frame * self.sim_substeps - 1]
+            self.sim_time += self.frame_dt
 
     def render(self):
         if self.renderer is None:
             return
 
         with wp.ScopedTimer("render"):
-            vertices = self.sim_verts.numpy()
-
-            self.renderer.begin_frame(self.sim_time)
-            self.renderer.render_mesh("surface", vertices, self.indices, colors=((0.35, 0.55, 0.9),) * len(vertices))
-            self.renderer.render_sphere(
-                "sphere",
-                (self.cx * self.grid_size, 0.0, self.cy * self.grid_size),
-                (0.0, 0.0, 0.0, 1.0),
-                10.0 * self.grid_size,
-                color=(1.0, 1.0, 1.0),
-            )
-            self.renderer.end_frame()
+            if self.use_async_copy:
+                (self.sim_verts, self.sim_verts_back) = (self.sim_verts_back, self.sim_verts)
+
+            with wp.ScopedTimer("mesh", self.verbose):
+                # update grid vertices from heights
+                wp.launch(
+                    kernel=grid_update,
+                    dim=(self.sim_height, self.sim_width),
+                    inputs=[self.sim_grid0, self.sim_verts],
+                )
+
+            if self.use_async_copy:
+                buffer = self.render_frame % 2
+
+                self.copy_stream.wait_stream(wp.get_stream())
+                wp.copy(self.host_verts[buffer], self.sim_verts, stream=self.copy_stream)
+                self.copy_events[buffer] = self.copy_stream.record_event()
+
+                # write the previous frame
+                pending_frame = self.pending_frame
+                self.pending_frame = (buffer, self.sim_time, self.cx, self.cy)
+
+                if pending_frame is not None:
+                    self.render_pending(*pending_frame)
+            else:
+                self.render_surface(self.sim_verts.numpy(), self.sim_time, self.cx, self.cy)
+
+            self.render_frame += 1
+
+    def save(self):
+        if self.renderer is None:
+            return
+
+        # write the pending frame
+        if self.use_async_copy and self.pending_frame is not None:
+            self.render_pending(*self.pending_frame)
+            self.pending_frame = None
+
+        self.renderer.save()
+
+    def render_pending(self, buffer, sim_time, cx, cy):
+        wp.synchronize_event(self.copy_events[buffer])
+        self.render_surface(self.host_verts[buffer].numpy(), sim_time, cx, cy)
+
+    def render_surface(self, vertices, sim_time, cx, cy):
+        # colors are constant, only write them once
+        surface_colors = None
+        sphere_color = None
+        if not self.surface_rendered:
+            surface_colors = np.full((len(vertices), 3), (0.35, 0.55, 0.9), dtype=np.float32)
+            sphere_color = (1.0, 1.0, 1.0)
+            self.surface_rendered = True
+
+        self.renderer.begin_frame(sim_time)
+        self.renderer.render_mesh("surface", vertices, self.indices, colors=surface_colors)
+        self.renderer.render_sphere(
+            "sphere",
+            (cx * self.grid_size, 0.0, cy * self.grid_size),
+            (0.0, 0.0, 0.0, 1.0),
+            10.0 * self.grid_size,
+            color=sphere_color,
+        )
+        self.renderer.end_frame()
 
 
 if __name__ == "__main__":
@@ -247,15 +558,25 @@ if __name__ == "__main__":
     )
     parser.add_argument("--num_frames", type=int, default=300, help="Total number of frames.")
     parser.add_argument("--verbose", action="store_true", help="Print out additional status messages during execution.")
+    parser.add_argument(
+        "--max_blocks", type=int, default=0, help="Maximum number of CUDA blocks of the wave solve, 0 for no limit."
+    )
+    parser.add_argument(
+        "--verify_cuda",
+        action="store_true",
+        help="Check for CUDA errors after every launch, for debugging only since it synchronizes the device.",
+    )
 
     args = parser.parse_known_args()[0]
 
+    if args.verify_cuda:
+        wp.config.verify_cuda = True
+
     with wp.ScopedDevice(args.device):
-        example = Example(stage_path=args.stage_path, verbose=args.verbose)
+        example = Example(stage_path=args.stage_path, verbose=args.verbose, max_blocks=args.max_blocks)
 
         for _ in range(args.num_frames):
             example.step()
             example.render()
 
-        if example.renderer:
-            example.renderer.save()
+        example.save()
@@ -566,7 +566,7 @@ class UsdRenderer:
         parent_body: str = None,
         is_template: bool = False,
     ):
-        from pxr import Sdf, UsdGeom
+        from pxr import Sdf, UsdGeom, Vt
 
         if is_template:
             prim_path = self._resolve_path(name, parent_body, is_template)
@@ -588,14 +588,21 @@ class UsdRenderer:
             # force topology update on first frame
             update_topology = True
 
+        if isinstance(points, np.ndarray):
+            # copy NumPy data directly into a VtArray instead of converting element-wise
+            points = Vt.Vec3fArray.FromNumpy(points.reshape(-1, 3))
+
         mesh.GetPointsAttr().Set(points, self.time)
 
         if update_topology:
-            idxs = np.array(indices).reshape(-1, 3)
-            mesh.GetFaceVertexIndicesAttr().Set(idxs, self.time)
-            mesh.GetFaceVertexCountsAttr().Set([3] * len(idxs), self.time)
+            idxs = np.asarray(indices, dtype=np.int32).reshape(-1)
+            mesh.GetFaceVertexIndicesAttr().Set(Vt.IntArray.FromNumpy(idxs), self.time)
+            mesh.GetFaceVertexCountsAttr().Set(Vt.IntArray(len(idxs) // 3, 3), self.time)
+
+        if isinstance(colors, np.ndarray):
+            colors = Vt.Vec3fArray.FromNumpy(colors.reshape(-1, 3))
 
-        if colors:
+        if colors is not None and len(colors):
             mesh.GetDisplayColorAttr().Set(colors, self.time)
 
         self._shape_constructors[name] = UsdGeom.Mesh
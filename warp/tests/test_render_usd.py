@@ -0,0 +1,78 @@
+# Copyright (c) 2024 NVIDIA CORPORATION.  All rights reserved.
+# NVIDIA CORPORATION and its licensors retain all intellectual property
+# and proprietary rights in and to this software, related documentation
+# and any modifications thereto.  Any use, reproduction, disclosure or
+# distribution of this software and related documentation without an express
+# license agreement from NVIDIA CORPORATION is strictly prohibited.
+
+import unittest
+
+import numpy as np
+
+import warp as wp
+import warp.render
+from warp.tests.unittest_utils import *
+
+
+def get_mesh_data():
+    # two triangles spanning a unit quad
+    points = np.array(((0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (1.0, 0.0, 1.0), (0.0, 0.0, 1.0)), dtype=np.float32)
+    indices = np.array(((0, 2, 1), (0, 3, 2)), dtype=np.int32)
+
+    return points, indices
+
+
+@unittest.skipUnless(USD_AVAILABLE, "Requires usd-core")
+class TestRenderUsd(unittest.TestCase):
+    def test_render_mesh_numpy(self):
+        from pxr import Usd, UsdGeom
+
+        points, indices = get_mesh_data()
+        colors = np.full((len(points), 3), (0.25, 0.5, 0.75), dtype=np.float32)
+
+        renderer = wp.render.UsdRenderer(Usd.Stage.CreateInMemory())
+
+        renderer.begin_frame(0.0)
+        renderer.render_mesh("mesh", points, indices, colors=colors)
+        renderer.end_frame()
+        first_time = renderer.time
+
+        # topology is only written on the first frame
+        moved_points = points + np.array((0.0, 1.0, 0.0), dtype=np.float32)
+
+        renderer.begin_frame(1.0)
+        renderer.render_mesh("mesh", moved_points, indices)
+        renderer.end_frame()
+        second_time = renderer.time
+
+        mesh = UsdGeom.Mesh(renderer.stage.GetPrimAtPath("/root/mesh"))
+
+        assert_np_equal(np.array(mesh.GetPointsAttr().Get(first_time)), points)
+        assert_np_equal(np.array(mesh.GetPointsAttr().Get(second_time)), moved_points)
+        assert_np_equal(np.array(mesh.GetFaceVertexIndicesAttr().Get(second_time)), indices.flatten())
+        assert_np_equal(np.array(mesh.GetFaceVertexCountsAttr().Get(second_time)), np.full(len(indices), 3))
+        assert_np_equal(np.array(mesh.GetDisplayColorAttr().Get(second_time)), colors)
+
+    def test_render_mesh_sequences(self):
+        from pxr import Usd, UsdGeom
+
+        points, indices = get_mesh_data()
+        colors = ((0.25, 0.5, 0.75),) * len(points)
+
+        renderer = wp.render.UsdRenderer(Usd.Stage.CreateInMemory())
+
+        renderer.begin_frame(0.0)
+        renderer.render_mesh("mesh", points.tolist(), indices.flatten().tolist(), colors=colors)
+        renderer.end_frame()
+
+        mesh = UsdGeom.Mesh(renderer.stage.GetPrimAtPath("/root/mesh"))
+
+        assert_np_equal(np.array(mesh.GetPointsAttr().Get(0.0)), points)
+        assert_np_equal(np.array(mesh.GetFaceVertexIndicesAttr().Get(0.0)), indices.flatten())
+        assert_np_equal(np.array(mesh.GetFaceVertexCountsAttr().Get(0.0)), np.full(len(indices), 3))
+        assert_np_equal(np.array(mesh.GetDisplayColorAttr().Get(0.0)), np.array(colors))
+
+
+if __name__ == "__main__":
+    wp.clear_kernel_cache()
+    unittest.main(verbosity=2)
@@ -160,6 +160,7 @@ def default_suite(test_loader: unittest.TestLoader = unittest.defaultTestLoader)
     from warp.tests.test_quat import TestQuat
     from warp.tests.test_rand import TestRand
     from warp.tests.test_reload import TestReload
+    from warp.tests.test_render_usd import TestRenderUsd
     from warp.tests.test_rounding import TestRounding
     from warp.tests.test_runlength_encode import TestRunlengthEncode
     from warp.tests.test_scalar_ops import TestScalarOps
@@ -260,6 +261,7 @@ def default_suite(test_loader: unittest.TestLoader = unittest.defaultTestLoader)
         TestQuat,
         TestRand,
         TestReload,
+        TestRenderUsd,
         TestRounding,
         TestRunlengthEncode,
         TestScalarOps,